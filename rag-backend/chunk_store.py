@@ -0,0 +1,68 @@
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+DATA_DIR = Path(__file__).parent / "data"
+CHUNKS_DB = DATA_DIR / "chunks.sqlite"
+
+SNIPPET_LEN = 160
+
+# chunkIds restart at c00000 for every paper, so chunks are keyed by (paperId, chunkId)
+ChunkKey = Tuple[str, str]
+
+def _connect() -> sqlite3.Connection:
+    CHUNKS_DB.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(CHUNKS_DB))
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS chunks ("
+        " paperId TEXT NOT NULL,"
+        " chunkId TEXT NOT NULL,"
+        " paperTitle TEXT,"
+        " pageStart INTEGER,"
+        " pageEnd INTEGER,"
+        " text TEXT NOT NULL,"
+        " PRIMARY KEY (paperId, chunkId))"
+    )
+    return conn
+
+def save_chunks(docs: Iterable) -> None:
+    """
+    Stores chunk text + citation metadata for LangChain Documents.
+    """
+    rows = []
+    for d in docs:
+        md = d.metadata or {}
+        rows.append((
+            md.get("paperId", "unknown"),
+            md.get("chunkId", "unknown"),
+            md.get("paperTitle"),
+            md.get("pageStart"),
+            md.get("pageEnd"),
+            d.page_content,
+        ))
+    with closing(_connect()) as conn, conn:
+        conn.executemany("INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+def count_chunks() -> int:
+    with closing(_connect()) as conn:
+        return conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+def get_chunks(keys: List[ChunkKey]) -> List[Dict]:
+    """
+    Fetches chunks in one query, returned in the order of keys (missing ones skipped).
+    """
+    if not keys:
+        return []
+    values = ", ".join(["(?, ?)"] * len(keys))
+    params = [part for key in keys for part in key]
+    with closing(_connect()) as conn:
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute(
+            "SELECT paperId, chunkId, paperTitle, pageStart, pageEnd, text,"
+            f" substr(text, 1, {SNIPPET_LEN}) AS snippet, length(text) > {SNIPPET_LEN} AS truncated"
+            f" FROM chunks WHERE (paperId, chunkId) IN (VALUES {values})",
+            params,
+        ).fetchall()
+    by_key = {(r["paperId"], r["chunkId"]): dict(r) for r in rows}
+    return [by_key[k] for k in keys if k in by_key]
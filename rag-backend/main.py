@@ -1,20 +1,33 @@
+import aiofiles
 from fastapi import FastAPI, Request
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, ORJSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List, Literal, Optional
 from pathlib import Path
+import orjson
+import os
 import time
 import uuid
 
-from bedrock_llm import generate_answer_nova_micro
-from storage import load_papers, upsert_paper
-from rag import ingest_pdf, retrieve, format_citations, answer_extractively
+from bedrock_llm import NOT_FOUND_ANSWER, generate_answer_nova_micro, stream_answer_nova_micro
+from storage import load_papers, get_paper, upsert_paper, flush_papers
+from rag import ingest_pdf, load_global_vectorstore, retrieve, embed_query, dedupe_citations, format_citations, answer_extractively
+from proximity import ProximityCache
+from response_cache import ResponseCache
 
 DATA_DIR = Path(__file__).parent / "data"
 UPLOAD_DIR = DATA_DIR / "uploads"
 
-app = FastAPI()
+# orjson is much faster than stdlib json for the large citation payloads
+app = FastAPI(default_response_class=ORJSONResponse)
+
+# Near-duplicate questions (cosine >= 0.95) skip FAISS and reuse cached hits
+SEMANTIC_CACHE = ProximityCache(capacity=256, tau=0.95)
+
+# Exact re-asks (same paperFilter + normalized question) skip retrieval and Nova
+RESPONSE_CACHE = ResponseCache(capacity=512, ttl=3600)
 
 app.add_middleware(
     CORSMiddleware,
@@ -27,6 +40,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+def warm_vectorstores():
+    # Load the merged FAISS store up front so the first /chat doesn't pay for it
+    try:
+        load_global_vectorstore()
+    except Exception as e:
+        print("Could not pre-load global index:", repr(e))
+
+@app.on_event("shutdown")
+def flush_storage():
+    flush_papers()
+
 
 class Paper(BaseModel):
     paperId: str
@@ -66,8 +91,8 @@ class ChatResp(BaseModel):
     citations: List[Citation]
 
 @app.get("/papers", response_model=List[Paper])
-def get_papers():
-    return load_papers()
+async def get_papers():
+    return await run_in_threadpool(load_papers)
 
 @app.post("/upload-url", response_model=UploadUrlResp)
 def upload_url(req: UploadUrlReq):
@@ -78,38 +103,65 @@ def upload_url(req: UploadUrlReq):
 
 @app.put("/upload")
 async def upload_pdf(request: Request, key: str):
-    # Receives raw bytes body (like a presigned PUT)
-    pdf_bytes = await request.body()
-    if not pdf_bytes:
-        return {"ok": False, "error": "Empty body"}
-
+    # Receives raw bytes body (like a presigned PUT), streamed to a temp file
+    # and only moved under its real key once complete, so an aborted upload
+    # never leaves a truncated PDF for /ingest to pick up
     UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
     out_path = UPLOAD_DIR / key
-    out_path.write_bytes(pdf_bytes)
+    part_path = UPLOAD_DIR / f"{key}.part"
+
+    n_bytes = 0
+    try:
+        async with aiofiles.open(part_path, "wb") as f:
+            async for chunk in request.stream():
+                if chunk:
+                    await f.write(chunk)
+                    n_bytes += len(chunk)
+    except BaseException:
+        part_path.unlink(missing_ok=True)
+        raise
+
+    if n_bytes == 0:
+        part_path.unlink(missing_ok=True)
+        return {"ok": False, "error": "Empty body"}
+
+    os.replace(part_path, out_path)
     return {"ok": True, "path": str(out_path)}
 
 @app.post("/ingest", response_model=IngestResp)
-def ingest(req: IngestReq):
+async def ingest(req: IngestReq):
     pdf_path = UPLOAD_DIR / req.s3Key
     paper_id = f"p_{uuid.uuid4().hex[:10]}"
     title = req.s3Key.split("_")[-1].replace(".pdf", "").replace("-", " ")
 
     # mark processing
-    upsert_paper({"paperId": paper_id, "title": title, "status": "processing", "pdfKey": req.s3Key})
-
+    await run_in_threadpool(upsert_paper, {"paperId": paper_id, "title": title, "status": "processing", "pdfKey": req.s3Key})
 
+    # PDF parsing, Bedrock embedding and FAISS writes all block; keep them off the event loop
     try:
-        n_chunks = ingest_pdf(pdf_path, paper_id=paper_id, title=title)
-        upsert_paper({"paperId": paper_id, "title": title, "status": "indexed", "chunks": n_chunks, "pdfKey": req.s3Key})
+        n_chunks = await run_in_threadpool(ingest_pdf, pdf_path, paper_id=paper_id, title=title)
+        await run_in_threadpool(upsert_paper, {"paperId": paper_id, "title": title, "status": "indexed", "chunks": n_chunks, "pdfKey": req.s3Key})
+        # Corpus changed: cached answers and retrieval hits may be stale
+        RESPONSE_CACHE.invalidate()
+        SEMANTIC_CACHE.clear()
     except Exception:
-        upsert_paper({"paperId": paper_id, "title": title, "status": "failed"})
+        await run_in_threadpool(upsert_paper, {"paperId": paper_id, "title": title, "status": "failed"})
         raise
 
     return {"paperId": paper_id}
 
-@app.post("/chat", response_model=ChatResp)
-def chat(req: ChatReq):
-    papers = load_papers()
+def retrieve_cached(question: str, paper_ids: List[str]):
+    scope = tuple(sorted(paper_ids))
+    q_vec = embed_query(question)
+    keys = SEMANTIC_CACHE.lookup(q_vec, scope)
+    if keys is None:
+        keys = retrieve(question, paper_ids=paper_ids, k=6)
+        if keys:  # no hits usually means the paper isn't indexed yet
+            SEMANTIC_CACHE.insert(q_vec, scope, keys)
+    return keys
+
+async def retrieve_citations(req: ChatReq):
+    papers = await run_in_threadpool(load_papers)
     indexed = [p for p in papers if p.get("status") == "indexed"]
 
     if req.paperFilter != "all":
@@ -117,18 +169,32 @@ def chat(req: ChatReq):
     else:
         paper_ids = [p["paperId"] for p in indexed]
 
-    docs = retrieve(req.question, paper_ids=paper_ids, k=6)
-    citations = format_citations(docs)
+    # Titan embedding, FAISS search and the chunk lookup block; run them in the threadpool
+    keys = await run_in_threadpool(retrieve_cached, req.question, paper_ids)
+    citations = await run_in_threadpool(format_citations, keys)
+    citations = dedupe_citations(citations)
     for c in citations:
         c["pdfUrl"] = f"http://localhost:3001/pdf/{c['paperId']}"
+    return citations
+
+@app.post("/chat", response_model=ChatResp)
+async def chat(req: ChatReq):
+    cache_key = ResponseCache.key(req.paperFilter, req.question)
+    cached = RESPONSE_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+    cache_version = RESPONSE_CACHE.version
+
+    citations = await retrieve_citations(req)
 
     # Use Nova Micro to generate an answer grounded on retrieved chunks
     try:
-        answer = generate_answer_nova_micro(req.question, citations)
+        answer = await run_in_threadpool(generate_answer_nova_micro, req.question, citations)
+        RESPONSE_CACHE.set(cache_key, {"answer": answer, "citations": citations}, cache_version)
     except Exception as e:
         print("Error generating answer with Nova Micro:", repr(e))
         # Safe fallback so your app doesn't break during testing
-        answer = answer_extractively(req.question, docs)
+        answer = answer_extractively(req.question, citations)
 
     
     print("\n===== DEBUG: /chat response.answer (raw) =====\n")
@@ -137,20 +203,70 @@ def chat(req: ChatReq):
 
     return {"answer": answer, "citations": citations}
 
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {orjson.dumps(data).decode()}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream(req: ChatReq):
+    """
+    Same as /chat, but as Server-Sent Events: one "citations" event, then
+    "delta" events with answer text as Nova generates it, then "done".
+    If generation fails after some text was sent, an "error" event replaces "done".
+    """
+    cache_key = ResponseCache.key(req.paperFilter, req.question)
+    cached = RESPONSE_CACHE.get(cache_key)
+    if cached is not None:
+        def cached_events():
+            yield sse_event("citations", cached["citations"])
+            yield sse_event("delta", {"text": cached["answer"]})
+            yield sse_event("done", {})
+        return StreamingResponse(cached_events(), media_type="text/event-stream")
+    cache_version = RESPONSE_CACHE.version
+
+    citations = await retrieve_citations(req)
+
+    # Sync generator: StreamingResponse iterates it in the threadpool
+    def events():
+        yield sse_event("citations", citations)
+        parts = []
+        try:
+            for text in stream_answer_nova_micro(req.question, citations):
+                parts.append(text)
+                yield sse_event("delta", {"text": text})
+            answer = "".join(parts).strip() or NOT_FOUND_ANSWER
+            RESPONSE_CACHE.set(cache_key, {"answer": answer, "citations": citations}, cache_version)
+        except Exception as e:
+            print("Error streaming answer with Nova Micro:", repr(e))
+            if not parts:
+                # Nothing shown yet: same extractive fallback as /chat
+                yield sse_event("delta", {"text": answer_extractively(req.question, citations)})
+            else:
+                # Answer was cut off mid-stream; tell the client instead of ending quietly
+                yield sse_event("error", {"message": "Answer generation was interrupted."})
+                return
+        yield sse_event("done", {})
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
 
 @app.get("/pdf/{paper_id}")
 def get_pdf(paper_id: str):
-    papers = load_papers()
-    paper = next((p for p in papers if p.get("paperId") == paper_id), None)
+    paper = get_paper(paper_id)
     if not paper or not paper.get("pdfKey"):
         return {"ok": False, "error": "PDF not found"}
 
     pdf_path = UPLOAD_DIR / paper["pdfKey"]
-    if not pdf_path.exists():
+    try:
+        stat = pdf_path.stat()
+    except FileNotFoundError:
         return {"ok": False, "error": "PDF file missing on disk"}
 
+    # Passing stat_result skips FileResponse's own stat; the file is sent with
+    # sendfile where available, and Range requests are honoured.
     return FileResponse(
         path=str(pdf_path),
         media_type="application/pdf",
         filename=paper.get("title", "paper") + ".pdf",
+        stat_result=stat,
+        headers={"Cache-Control": "public, max-age=3600"},
     )
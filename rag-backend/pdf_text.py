@@ -0,0 +1,29 @@
+from pathlib import Path
+from typing import List
+
+import pymupdf
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 150
+
+def load_and_chunk_pdf(pdf_path: Path) -> List[Document]:
+    """
+    Extracts every page with PyMuPDF (C parser, much faster than pypdf) and
+    splits them into chunks, in page order. Page metadata matches what
+    PyPDFLoader produced: "source" and 0-indexed "page".
+    Runs serially: at ~1 ms/page this is negligible next to the one Titan
+    call per chunk, so a process pool doesn't pay for itself.
+    """
+    path = str(pdf_path)
+    with pymupdf.open(path) as pdf:
+        docs = [
+            Document(page_content=page.get_text("text"), metadata={"source": path, "page": i})
+            for i, page in enumerate(pdf)
+        ]
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP
+    )
+    return splitter.split_documents(docs)
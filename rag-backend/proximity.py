@@ -0,0 +1,80 @@
+import threading
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from chunk_store import ChunkKey
+
+
+class ProximityCache:
+    """
+    Semantic cache in front of FAISS retrieval.
+    Keeps a fixed-size matrix of past query vectors; a new query whose cosine
+    similarity to a cached one (same paper scope) is >= tau reuses its hits.
+    Only (paperId, chunkId) keys are stored per entry; text lives in chunks.sqlite.
+    """
+
+    def __init__(self, capacity: int = 256, tau: float = 0.95):
+        self.capacity = capacity
+        self.tau = tau
+        self._lock = threading.Lock()
+        self._q: Optional[np.ndarray] = None  # [capacity x d], unit rows
+        self._scopes: List[Optional[Tuple[str, ...]]] = [None] * capacity
+        self._hits: List[List[ChunkKey]] = [[] for _ in range(capacity)]
+        self._last_used = np.zeros(capacity, dtype=np.int64)  # 0 = empty slot
+        self._tick = 0
+
+    def lookup(self, q_vec: Sequence[float], scope: Tuple[str, ...]) -> Optional[List[ChunkKey]]:
+        q = self._unit(q_vec)
+        if q is None:
+            return None
+        with self._lock:
+            if self._q is None or self._q.shape[1] != q.shape[0]:
+                return None
+            mask = np.array([s == scope for s in self._scopes]) & (self._last_used > 0)
+            if not mask.any():
+                return None
+            sims = np.where(mask, self._q @ q, -1.0)
+            best = int(sims.argmax())
+            if sims[best] < self.tau:
+                return None
+            self._tick += 1
+            self._last_used[best] = self._tick
+            return list(self._hits[best])
+
+    def insert(self, q_vec: Sequence[float], scope: Tuple[str, ...], keys: List[ChunkKey]) -> None:
+        q = self._unit(q_vec)
+        if q is None:
+            return
+        with self._lock:
+            if self._q is None or self._q.shape[1] != q.shape[0]:
+                self._reset(q.shape[0])
+            # LRU eviction: empty slots have last_used == 0 and go first
+            slot = int(self._last_used.argmin())
+            self._tick += 1
+            self._q[slot] = q
+            self._scopes[slot] = scope
+            self._hits[slot] = list(keys)
+            self._last_used[slot] = self._tick
+
+    def clear(self) -> None:
+        with self._lock:
+            self._q = None
+            self._scopes = [None] * self.capacity
+            self._hits = [[] for _ in range(self.capacity)]
+            self._last_used[:] = 0
+
+    def _reset(self, dim: int) -> None:
+        self._q = np.zeros((self.capacity, dim), dtype=np.float32)
+        self._scopes = [None] * self.capacity
+        self._hits = [[] for _ in range(self.capacity)]
+        self._last_used[:] = 0
+
+    @staticmethod
+    def _unit(q_vec: Sequence[float]) -> Optional[np.ndarray]:
+        # Pre-normalizing rows and query turns cosine into a plain dot product
+        q = np.asarray(q_vec, dtype=np.float32)
+        norm = float(np.linalg.norm(q))
+        if norm == 0.0:
+            return None
+        return q / norm
@@ -1,12 +1,31 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 from typing import List, Tuple, Optional, Dict
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+import faiss
+import numpy as np
+from diskcache import Cache
 from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_core.documents import Document
 from langchain_aws import BedrockEmbeddings
 
+from chunk_store import ChunkKey, count_chunks, get_chunks, save_chunks
+from pdf_text import load_and_chunk_pdf
+from storage import load_papers
+
 DATA_DIR = Path(__file__).parent / "data"
 INDEX_DIR = DATA_DIR / "indexes"
+GLOBAL_INDEX_DIR = INDEX_DIR / "_global"
+SQ_TRAIN_META = GLOBAL_INDEX_DIR / "sq_train.json"
+EMBED_CACHE_DIR = DATA_DIR / "embed_cache"
 
 # Small + fast, good for local dev
 # EMBEDDINGS = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
@@ -16,92 +35,408 @@ EMBEDDINGS = BedrockEmbeddings(
     model_id="amazon.titan-embed-text-v2:0",
 )
 
+# Titan v2 takes one text per request (embed_documents loops over them), so a
+# batch is only a work item for the pool; small ones keep every worker busy
+EMBED_BATCH_SIZE = 8
+EMBED_WORKERS = 4
+
+# Evidence whose word-shingle Jaccard similarity exceeds this is a near-duplicate
+DEDUPE_JACCARD = 0.8
+
+# HNSW graph params for the global index (M neighbours per node)
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+
+# Global index stores vectors as int8 scalar-quantized codes, trained on up to this many vectors.
+# Until the sample reaches that size, the index is rebuilt (and the quantizer
+# retrained) each time the corpus doubles past it, so an early small upload
+# can't fix the quantization ranges for everything added later.
+SQ_TRAIN_SIZE = 10_000
+
+# Single merged FAISS store over all indexed papers, loaded once.
+# Copy-on-write: a published store is never mutated, so searches run without
+# a lock. Ingest extends a copy (serialized by _INGEST_LOCK), persists it, and
+# only then swaps _GLOBAL_VS under the short _GLOBAL_LOCK.
+_GLOBAL_VS: Optional[FAISS] = None
+_GLOBAL_TRAINED_ON = 0  # vectors the global quantizer was trained on
+_GLOBAL_LOCK = threading.RLock()
+_INGEST_LOCK = threading.Lock()
+
+# Query embeddings persisted across restarts, keyed by SHA-256 of the query
+_EMBED_CACHE = Cache(str(EMBED_CACHE_DIR))
+
+@lru_cache(maxsize=1024)
+def _embed_query(query: str) -> Tuple[float, ...]:
+    """
+    Embeds a query once; repeat questions are served from memory, then disk,
+    and only hit Titan on a full miss. Returned vector is unit-length.
+    """
+    key = hashlib.sha256(query.encode("utf-8")).hexdigest()
+    vec = _EMBED_CACHE.get(key)
+    if vec is None:
+        vec = tuple(EMBEDDINGS.embed_query(query))
+        _EMBED_CACHE.set(key, vec)
+    return tuple(_unit_rows(np.array([vec]))[0].tolist())
+
+def embed_query(query: str) -> List[float]:
+    return list(_embed_query(query))
+
+def _unit_rows(vecs: np.ndarray) -> np.ndarray:
+    # On unit vectors inner product == cosine similarity
+    vecs = np.ascontiguousarray(vecs, dtype=np.float32).copy()
+    faiss.normalize_L2(vecs)
+    return vecs
+
+def _embed_documents(texts: List[str]) -> List[List[float]]:
+    """
+    Embeds texts in small batches across a small thread pool.
+    Bedrock calls are network-bound, so threads overlap their latency.
+    """
+    batches = [texts[i:i + EMBED_BATCH_SIZE] for i in range(0, len(texts), EMBED_BATCH_SIZE)]
+    with ThreadPoolExecutor(max_workers=EMBED_WORKERS) as pool:
+        results = pool.map(EMBEDDINGS.embed_documents, batches)
+    return [vec for batch_vecs in results for vec in batch_vecs]
+
 def ingest_pdf(pdf_path: Path, paper_id: str, title: str) -> int:
     """
     Loads PDF with page metadata, chunks it, builds FAISS index, saves to disk.
     Returns number of chunks indexed.
     """
-    loader = PyPDFLoader(str(pdf_path))
-    docs = loader.load()  # each doc has metadata including "page"
-
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=150
-    )
-    chunks = splitter.split_documents(docs)
+    chunks = load_and_chunk_pdf(pdf_path)  # each chunk has metadata including "page"
 
     # Add your metadata needed for citations
     for i, d in enumerate(chunks):
         d.metadata["paperId"] = paper_id
         d.metadata["paperTitle"] = title
         d.metadata["chunkId"] = f"c{i:05d}"
-        # PyPDFLoader uses 0-index page; we’ll store 1-index for user display
+        # Pages are 0-indexed; we’ll store 1-index for user display
         if "page" in d.metadata and isinstance(d.metadata["page"], int):
             d.metadata["pageStart"] = d.metadata["page"] + 1
             d.metadata["pageEnd"] = d.metadata["page"] + 1
 
-    vs = FAISS.from_documents(chunks, EMBEDDINGS)
+    texts = [d.page_content for d in chunks]
+    vecs = _unit_rows(np.array(_embed_documents(texts))).tolist()
+    vs = FAISS.from_embeddings(
+        list(zip(texts, vecs)),
+        EMBEDDINGS,
+        metadatas=[d.metadata for d in chunks],
+    )
 
     out_dir = INDEX_DIR / paper_id
     out_dir.mkdir(parents=True, exist_ok=True)
     vs.save_local(str(out_dir))
 
+    # Per-paper index stays on disk so the global one can be rebuilt from it
+    _merge_into_global(vs)
+
     return len(chunks)
 
 def load_vectorstore(paper_id: str) -> FAISS:
     path = INDEX_DIR / paper_id
     return FAISS.load_local(str(path), EMBEDDINGS, allow_dangerous_deserialization=True)
 
-def retrieve(query: str, paper_ids: List[str], k: int = 6):
+def load_global_vectorstore() -> Optional[FAISS]:
     """
-    Global top-k across multiple FAISS indexes using similarity scores.
+    Returns the merged index of all papers, loading it from disk on first use.
+    If it was never persisted (older data dir), or the chunk store is missing
+    chunks it references, it is rebuilt from the per-paper indexes of every
+    indexed paper.
     """
-    scored = []
-    per_paper_k = max(2, k)  # get enough from each paper to compete globally
+    global _GLOBAL_VS, _GLOBAL_TRAINED_ON
+    if _GLOBAL_VS is not None:
+        return _GLOBAL_VS
+    with _GLOBAL_LOCK:
+        if _GLOBAL_VS is None:
+            if (GLOBAL_INDEX_DIR / "index.faiss").exists():
+                if SQ_TRAIN_META.exists():
+                    _GLOBAL_TRAINED_ON = json.loads(SQ_TRAIN_META.read_text())["trainedOn"]
+                _GLOBAL_VS = FAISS.load_local(
+                    str(GLOBAL_INDEX_DIR), EMBEDDINGS, allow_dangerous_deserialization=True
+                )
+                _GLOBAL_VS.distance_strategy = DistanceStrategy.MAX_INNER_PRODUCT
+                if isinstance(_GLOBAL_VS.index, faiss.IndexHNSW):
+                    _GLOBAL_VS.index.hnsw.efSearch = HNSW_EF_SEARCH
+                if (_GLOBAL_VS.index.metric_type != faiss.METRIC_INNER_PRODUCT
+                        or count_chunks() < _GLOBAL_VS.index.ntotal):
+                    # Older L2 index, or chunk text not yet in chunks.sqlite
+                    _GLOBAL_VS = _rebuild_global_vectorstore(_indexed_paper_ids())
+            else:
+                _GLOBAL_VS = _rebuild_global_vectorstore(_indexed_paper_ids())
+        return _GLOBAL_VS
 
-    for pid in paper_ids:
-        vs = load_vectorstore(pid)
-        # Returns: List[Tuple[Document, score]] (lower score = closer for L2)
-        docs_scores = vs.similarity_search_with_score(query, k=per_paper_k)
-        for doc, score in docs_scores:
-            scored.append((doc, score))
+def _indexed_paper_ids() -> List[str]:
+    return [p["paperId"] for p in load_papers() if p.get("status") == "indexed"]
+
+def _new_global_vectorstore(train_vectors: np.ndarray) -> FAISS:
+    """
+    Empty HNSW store over 8-bit scalar-quantized vectors: ~M*log(N) distance
+    calcs per query instead of N, on codes 4x smaller than FP32.
+    Uses inner product on unit vectors, i.e. cosine similarity.
+    The quantizer learns per-dimension ranges from train_vectors, so they
+    should be a sample of the whole corpus (see _train_sample).
+    """
+    index = faiss.IndexHNSWSQ(
+        train_vectors.shape[1], faiss.ScalarQuantizer.QT_8bit, HNSW_M, faiss.METRIC_INNER_PRODUCT
+    )
+    index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    index.hnsw.efSearch = HNSW_EF_SEARCH
+    index.train(train_vectors)
+    return FAISS(
+        embedding_function=EMBEDDINGS,
+        index=index,
+        docstore=InMemoryDocstore(),
+        index_to_docstore_id={},
+        distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+    )
+
+def _append_vectorstore(target: FAISS, source: FAISS) -> None:
+    """
+    Adds source's vectors and docs to target. FAISS's merge_from only works
+    between flat/IVF indexes, so HNSW is grown with plain add() instead
+    (which also quantizes the vectors for the SQ index).
+    Chunk text goes to chunks.sqlite; target's docstore keeps only the ids.
+    """
+    n = source.index.ntotal
+    if n == 0:
+        return
+    docs = {doc_id: source.docstore.search(doc_id) for doc_id in source.index_to_docstore_id.values()}
+    save_chunks(docs.values())
+
+    start = target.index.ntotal
+    target.index.add(_all_vectors(source))
+    target.docstore.add({
+        doc_id: Document(
+            page_content="",
+            metadata={"paperId": d.metadata.get("paperId"), "chunkId": d.metadata.get("chunkId")},
+        )
+        for doc_id, d in docs.items()
+    })
+    for i, doc_id in source.index_to_docstore_id.items():
+        target.index_to_docstore_id[start + i] = doc_id
+
+def _copy_vectorstore(vs: FAISS) -> FAISS:
+    # (De)serializing clones any FAISS index type, including HNSW+SQ
+    return FAISS(
+        embedding_function=EMBEDDINGS,
+        index=faiss.deserialize_index(faiss.serialize_index(vs.index)),
+        docstore=InMemoryDocstore({
+            doc_id: vs.docstore.search(doc_id) for doc_id in vs.index_to_docstore_id.values()
+        }),
+        index_to_docstore_id=dict(vs.index_to_docstore_id),
+        distance_strategy=vs.distance_strategy,
+    )
 
-    # Sort by score (best first) and take global top-k
-    scored.sort(key=lambda x: x[1])
-    top_docs = [doc for doc, _ in scored[:k]]
-    return top_docs
+def _all_vectors(vs: FAISS) -> np.ndarray:
+    # Normalized here too, so per-paper indexes built before normalization still work
+    return _unit_rows(vs.index.reconstruct_n(0, vs.index.ntotal))
 
+def _train_sample(stores: List[FAISS]) -> np.ndarray:
+    # Up to SQ_TRAIN_SIZE vectors, drawn evenly from every paper
+    rng = np.random.default_rng(0)
+    per_paper = max(1, SQ_TRAIN_SIZE // len(stores))
+    parts = []
+    for vs in stores:
+        vecs = _all_vectors(vs)
+        if len(vecs) > per_paper:
+            vecs = vecs[rng.choice(len(vecs), per_paper, replace=False)]
+        parts.append(vecs)
+    sample = np.vstack(parts)
+    if len(sample) > SQ_TRAIN_SIZE:
+        sample = sample[rng.choice(len(sample), SQ_TRAIN_SIZE, replace=False)]
+    return sample
 
-def format_citations(docs) -> List[Dict]:
+def _global_paper_ids(vs: FAISS) -> List[str]:
+    return list(dict.fromkeys(
+        vs.docstore.search(doc_id).metadata["paperId"] for doc_id in vs.index_to_docstore_id.values()
+    ))
+
+def _rebuild_global_vectorstore(paper_ids: List[str], extra: List[FAISS] = ()) -> Optional[FAISS]:
+    """
+    Builds the global index from the per-paper indexes of paper_ids (plus
+    already-loaded stores in extra), retraining the quantizer on all of them.
+    """
+    global _GLOBAL_TRAINED_ON
+    stores = [load_vectorstore(pid) for pid in paper_ids if (INDEX_DIR / pid).exists()]
+    stores = [vs for vs in stores + list(extra) if vs.index.ntotal > 0]
+    if not stores:
+        return None
+
+    train = _train_sample(stores)
+    merged = _new_global_vectorstore(train)
+    for vs in stores:
+        _append_vectorstore(merged, vs)
+    _save_global_vectorstore(merged, trained_on=len(train))
+    _GLOBAL_TRAINED_ON = len(train)
+    return merged
+
+def _save_global_vectorstore(vs: FAISS, trained_on: int) -> None:
+    """
+    Writes index.faiss, index.pkl and sq_train.json to a sibling temp dir and
+    renames it into place, so a crash can't leave a new index.faiss next to an
+    old index.pkl. A crash between the two renames leaves no global dir, and
+    load_global_vectorstore rebuilds it from the per-paper indexes.
+    """
+    tmp_dir = GLOBAL_INDEX_DIR.with_name(GLOBAL_INDEX_DIR.name + ".tmp")
+    old_dir = GLOBAL_INDEX_DIR.with_name(GLOBAL_INDEX_DIR.name + ".old")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    vs.save_local(str(tmp_dir))
+    (tmp_dir / SQ_TRAIN_META.name).write_text(json.dumps({"trainedOn": trained_on}))
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if GLOBAL_INDEX_DIR.exists():
+        os.replace(GLOBAL_INDEX_DIR, old_dir)  # can't replace a non-empty dir directly
+    os.replace(tmp_dir, GLOBAL_INDEX_DIR)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+def _merge_into_global(vs: FAISS) -> None:
+    global _GLOBAL_VS
+    if vs.index.ntotal == 0:
+        return
+    # Everything slow (copy, sqlite, disk, rebuild) happens outside _GLOBAL_LOCK,
+    # so concurrent searches keep using the current store meanwhile
+    with _INGEST_LOCK:
+        current = load_global_vectorstore()
+        if current is None:
+            new_vs = _rebuild_global_vectorstore([], extra=[vs])
+        elif (_GLOBAL_TRAINED_ON < SQ_TRAIN_SIZE
+                and current.index.ntotal + vs.index.ntotal >= 2 * _GLOBAL_TRAINED_ON):
+            # Corpus has outgrown the quantizer's training sample: retrain on everything
+            new_vs = _rebuild_global_vectorstore(_global_paper_ids(current), extra=[vs])
+        else:
+            new_vs = _copy_vectorstore(current)
+            _append_vectorstore(new_vs, vs)
+            _save_global_vectorstore(new_vs, trained_on=_GLOBAL_TRAINED_ON)
+        with _GLOBAL_LOCK:
+            _GLOBAL_VS = new_vs
+
+def _doc_key(vs: FAISS, i: int) -> ChunkKey:
+    md = vs.docstore.search(vs.index_to_docstore_id[i]).metadata
+    return (md["paperId"], md["chunkId"])
+
+# (store, paperId -> FAISS ids) for the current global store
+_IDS_BY_PAPER: Tuple[Optional[FAISS], Dict[str, np.ndarray]] = (None, {})
+
+def _ids_by_paper(vs: FAISS) -> Dict[str, np.ndarray]:
+    global _IDS_BY_PAPER
+    cached_vs, ids = _IDS_BY_PAPER
+    if cached_vs is not vs:
+        groups: Dict[str, List[int]] = {}
+        for i in vs.index_to_docstore_id:
+            groups.setdefault(_doc_key(vs, i)[0], []).append(i)
+        ids = {pid: np.array(v, dtype=np.int64) for pid, v in groups.items()}
+        _IDS_BY_PAPER = (vs, ids)
+    return ids
+
+def _search_paper(vs: FAISS, paper_id: str, vec: List[float], k: int) -> List[ChunkKey]:
+    """
+    Exact top-k over one paper's codes in the global index. A single-paper
+    filter on the HNSW graph can come back short, because graph search stops
+    early; a flat scan of the graph's SQ storage restricted to that paper's
+    ids can't, and needs no second FP32 copy of the vectors.
+    """
+    ids = _ids_by_paper(vs).get(paper_id)
+    if ids is None:
+        return []  # still processing, or failed
+    index = vs.index
+    if isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.storage)
+    params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(ids))
+    _, idx = index.search(np.asarray([vec], dtype=np.float32), k, params=params)
+    return [_doc_key(vs, int(i)) for i in idx[0] if i >= 0]
+
+def retrieve(query: str, paper_ids: List[str], k: int = 6) -> List[ChunkKey]:
+    """
+    Top-k (paperId, chunkId) keys by cosine similarity, restricted to paper_ids.
+    One paper is scanned exactly; several go through the global HNSW graph.
+    Chunk text is fetched later by format_citations.
+    """
+    if not paper_ids:
+        return []
+
+    # No lock: the published store is never mutated (see _GLOBAL_VS)
+    vs = load_global_vectorstore()
+    if vs is None:
+        return []
+
+    vec = embed_query(query)
+    if len(paper_ids) == 1:
+        return _search_paper(vs, paper_ids[0], vec, k)
+
+    params = None
+    ids_by_paper = _ids_by_paper(vs)
+    wanted = set(paper_ids)
+    if any(pid not in wanted for pid in ids_by_paper):
+        # Restrict the graph search itself to the wanted papers' ids
+        ids = [ids_by_paper[pid] for pid in paper_ids if pid in ids_by_paper]
+        if not ids:
+            return []
+        selector = faiss.IDSelectorBatch(np.concatenate(ids))
+        if isinstance(vs.index, faiss.IndexHNSW):
+            params = faiss.SearchParametersHNSW(sel=selector, efSearch=max(HNSW_EF_SEARCH, k))
+        else:
+            params = faiss.SearchParameters(sel=selector)
+
+    _, idx = vs.index.search(np.asarray([vec], dtype=np.float32), k, params=params)
+    return [_doc_key(vs, int(i)) for i in idx[0] if i >= 0]
+
+
+def format_citations(keys: List[ChunkKey]) -> List[Dict]:
+    """
+    Builds citations for retrieved chunk keys with a single chunks.sqlite lookup.
+    """
     citations = []
-    for d in docs:
-        md = d.metadata or {}
+    for row in get_chunks(keys):
         citations.append({
-            "paperId": md.get("paperId", "unknown"),
-            "paperTitle": md.get("paperTitle", "unknown"),
-            "section": md.get("section"),  # optional if you add sectioning later
-            "pageStart": md.get("pageStart"),
-            "pageEnd": md.get("pageEnd"),
-            "chunkId": md.get("chunkId", "unknown"),
-            "snippet": (d.page_content[:160] + "…") if len(d.page_content) > 160 else d.page_content,
-            "text": d.page_content,
+            "paperId": row["paperId"],
+            "paperTitle": row["paperTitle"] or "unknown",
+            "section": None,  # optional if you add sectioning later
+            "pageStart": row["pageStart"],
+            "pageEnd": row["pageEnd"],
+            "chunkId": row["chunkId"],
+            "snippet": row["snippet"] + "…" if row["truncated"] else row["snippet"],
+            "text": row["text"],
             "pdfUrl": None,  # local mode: we’ll fill this in main.py
         })
     return citations
 
-def answer_extractively(question: str, docs) -> str:
+def _shingles(text: str, n: int = 3) -> set:
+    words = re.findall(r"\w+", text.lower())
+    return {tuple(words[i:i + n]) for i in range(max(1, len(words) - n + 1))}
+
+def dedupe_citations(citations: List[Dict]) -> List[Dict]:
+    """
+    Drops exact and near-duplicate chunks (keeping the best-ranked one), so
+    Nova isn't sent the same evidence twice. Runs before citations are
+    numbered, so [i] in the answer still matches the returned citations.
+    """
+    kept = []
+    seen_hashes = set()
+    kept_shingles = []
+    for c in citations:
+        text = " ".join(c["text"].split())
+        key = hashlib.blake2b(text[:512].encode("utf-8"), digest_size=8).digest()
+        if key in seen_hashes:
+            continue
+        sh = _shingles(text)
+        if any(len(sh & other) / len(sh | other) > DEDUPE_JACCARD for other in kept_shingles):
+            continue
+        seen_hashes.add(key)
+        kept_shingles.append(sh)
+        kept.append(c)
+    return kept
+
+def answer_extractively(question: str, citations: List[Dict]) -> str:
     """
     MVP answer without an LLM: stitches a concise response from evidence.
     Later you’ll replace this with an LLM call (Bedrock/Ollama).
     """
-    if not docs:
+    if not citations:
         return "Not found in the provided papers."
 
     bullets = []
-    for i, d in enumerate(docs, start=1):
-        md = d.metadata or {}
-        page = md.get("pageStart", "?")
-        bullets.append(f"- Evidence [{i}] (p. {page}): {d.page_content.strip()[:220]}")
+    for i, c in enumerate(citations, start=1):
+        page = c.get("pageStart") or "?"
+        bullets.append(f"- Evidence [{i}] (p. {page}): {c['text'].strip()[:220]}")
 
     return (
         "Evidence-based response (MVP, extractive):\n\n"
@@ -0,0 +1,55 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+class ResponseCache:
+    """
+    In-process TTL + LRU cache of full /chat responses ({answer, citations}),
+    keyed by (paperFilter, normalized question). invalidate() bumps a version
+    whenever the corpus changes: entries are dropped, and answers computed by
+    requests that started before the bump are refused by set().
+    """
+
+    def __init__(self, capacity: int = 512, ttl: float = 3600.0):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, value)
+        self.version = 0
+
+    @staticmethod
+    def key(paper_filter: str, question: str) -> str:
+        raw = f"{paper_filter}|{question.strip().lower()}"
+        return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Dict, version: int) -> None:
+        """
+        version: self.version as read before the response was computed.
+        """
+        with self._lock:
+            if version != self.version:
+                return  # corpus changed while this answer was being built
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
@@ -1,24 +1,102 @@
+import atexit
 import json
+import os
+import threading
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 DATA_DIR = Path(__file__).parent / "data"
 PAPERS_JSON = DATA_DIR / "papers.json"
 
+# Seconds to wait before writing, so bursts of upserts become one write
+FLUSH_DELAY = 0.5
+
+# Statuses that only mark papers.json dirty; they are written along with the
+# paper's terminal status (or at shutdown), so an ingest costs one write.
+# A crash mid-ingest loses only a "processing" entry that would be stale anyway.
+TRANSIENT_STATUSES = {"processing"}
+
+# In-memory copy of papers.json, loaded once; the file is written only when dirty
+_PAPERS: Optional[List[Dict]] = None
+_PAPERS_BY_ID: Dict[str, Dict] = {}
+_LOCK = threading.RLock()
+_FLUSH_TIMER: Optional[threading.Timer] = None
+_DIRTY = False
+
+def _papers() -> List[Dict]:
+    global _PAPERS
+    with _LOCK:
+        if _PAPERS is None:
+            if PAPERS_JSON.exists():
+                _PAPERS = json.loads(PAPERS_JSON.read_text(encoding="utf-8"))
+            else:
+                _PAPERS = []
+            _reindex()
+        return _PAPERS
+
+def _reindex() -> None:
+    _PAPERS_BY_ID.clear()
+    _PAPERS_BY_ID.update((p["paperId"], p) for p in _PAPERS or [])
+
 def load_papers() -> List[Dict]:
-    if not PAPERS_JSON.exists():
-        return []
-    return json.loads(PAPERS_JSON.read_text(encoding="utf-8"))
+    with _LOCK:
+        return [dict(p) for p in _papers()]
+
+def get_paper(paper_id: str) -> Optional[Dict]:
+    with _LOCK:
+        _papers()
+        paper = _PAPERS_BY_ID.get(paper_id)
+        return dict(paper) if paper is not None else None
 
 def save_papers(papers: List[Dict]) -> None:
-    PAPERS_JSON.parent.mkdir(parents=True, exist_ok=True)
-    PAPERS_JSON.write_text(json.dumps(papers, indent=2), encoding="utf-8")
+    global _PAPERS
+    with _LOCK:
+        _PAPERS = [dict(p) for p in papers]
+        _reindex()
+        _schedule_flush()
 
 def upsert_paper(paper: Dict) -> None:
-    papers = load_papers()
-    idx = next((i for i,p in enumerate(papers) if p["paperId"] == paper["paperId"]), None)
-    if idx is None:
-        papers.insert(0, paper)
-    else:
-        papers[idx] = paper
-    save_papers(papers)
+    global _DIRTY
+    with _LOCK:
+        papers = _papers()
+        idx = next((i for i,p in enumerate(papers) if p["paperId"] == paper["paperId"]), None)
+        paper = dict(paper)
+        if idx is None:
+            papers.insert(0, paper)
+        else:
+            papers[idx] = paper
+        _PAPERS_BY_ID[paper["paperId"]] = paper
+        if paper.get("status") in TRANSIENT_STATUSES:
+            _DIRTY = True
+        else:
+            _schedule_flush()
+
+def _schedule_flush() -> None:
+    global _FLUSH_TIMER, _DIRTY
+    with _LOCK:
+        _DIRTY = True
+        if _FLUSH_TIMER is not None:
+            return  # a pending write will pick up this change
+        _FLUSH_TIMER = threading.Timer(FLUSH_DELAY, flush_papers)
+        _FLUSH_TIMER.daemon = True
+        _FLUSH_TIMER.start()
+
+def flush_papers() -> None:
+    """
+    Writes the in-memory papers to papers.json atomically (tmp file + os.replace).
+    """
+    global _FLUSH_TIMER, _DIRTY
+    with _LOCK:
+        if _FLUSH_TIMER is not None:
+            _FLUSH_TIMER.cancel()
+            _FLUSH_TIMER = None
+        if not _DIRTY or _PAPERS is None:
+            return
+        PAPERS_JSON.parent.mkdir(parents=True, exist_ok=True)
+        tmp = PAPERS_JSON.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(_PAPERS, indent=2), encoding="utf-8")
+        os.replace(tmp, PAPERS_JSON)
+        _DIRTY = False
+
+# Don't lose a pending debounced write on shutdown
+atexit.register(flush_papers)
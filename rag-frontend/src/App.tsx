@@ -1,5 +1,5 @@
 import { useEffect, useMemo, useState } from "react";
-import { chat, getPapers, getUploadUrl, ingest, uploadToS3, type Citation, type Paper } from "./api";
+import { chatStream, getPapers, getUploadUrl, ingest, uploadToS3, type Citation, type Paper } from "./api";
 import "./styles.css";
 import { BlockMath, InlineMath } from "react-katex";
 
@@ -88,10 +88,25 @@ export default function App() {
     setMessages((m) => [...m, { role: "user", content: q }]);
 
     try {
-      const res = await chat(q, paperFilter);
-      setMessages((m) => [...m, { role: "assistant", content: res.answer }]);
-      setCitations(res.citations ?? []);
-      setSelectedCitation(res.citations?.[0] ?? null);
+      let started = false;
+      await chatStream(q, paperFilter, {
+        onCitations: (cits) => {
+          setCitations(cits ?? []);
+          setSelectedCitation(cits?.[0] ?? null);
+        },
+        onDelta: (text) => {
+          if (!started) {
+            started = true;
+            setMessages((m) => [...m, { role: "assistant", content: text }]);
+            return;
+          }
+          // append to the assistant message being streamed (always the last one)
+          setMessages((m) => {
+            const last = m[m.length - 1];
+            return [...m.slice(0, -1), { ...last, content: last.content + text }];
+          });
+        },
+      });
     } catch (e: any) {
       setMessages((m) => [...m, { role: "assistant", content: `Error: ${e?.message ?? "chat failed"}` }]);
     } finally {
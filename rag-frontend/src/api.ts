@@ -218,3 +218,64 @@ export async function chat(question: string, paperFilter: string): Promise<ChatR
 
   return { answer, citations };
 }
+
+export type ChatStreamHandlers = {
+  onCitations: (citations: Citation[]) => void;
+  onDelta: (text: string) => void;
+};
+
+// Streams /chat/stream (Server-Sent Events over POST): citations first, then answer deltas.
+// Rejects if the server reports an "error" event (answer cut off mid-stream).
+export async function chatStream(question: string, paperFilter: string, handlers: ChatStreamHandlers): Promise<void> {
+  if (USE_MOCK) {
+    const res = await chat(question, paperFilter);
+    handlers.onCitations(res.citations);
+    // mock: emit the answer word by word
+    for (const word of res.answer.split(/(?<=\s)/)) {
+      handlers.onDelta(word);
+      await sleep(15);
+    }
+    return;
+  }
+
+  const res = await fetch(`${API_BASE}/chat/stream`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ question, paperFilter }),
+  });
+  if (!res.ok || !res.body) {
+    const msg = await res.text().catch(() => "");
+    throw new Error(`API error ${res.status}: ${msg || res.statusText}`);
+  }
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    // SSE events are separated by a blank line
+    let sep: number;
+    while ((sep = buffer.indexOf("\n\n")) !== -1) {
+      const raw = buffer.slice(0, sep);
+      buffer = buffer.slice(sep + 2);
+
+      let event = "message";
+      let data = "";
+      for (const line of raw.split("\n")) {
+        if (line.startsWith("event: ")) event = line.slice(7);
+        else if (line.startsWith("data: ")) data += line.slice(6);
+      }
+      if (!data) continue;
+
+      const payload = JSON.parse(data);
+      if (event === "citations") handlers.onCitations(payload as Citation[]);
+      else if (event === "delta") handlers.onDelta(payload.text ?? "");
+      else if (event === "error") throw new Error(payload.message ?? "answer generation failed");
+      else if (event === "done") return;
+    }
+  }
+}